@@ -1,57 +1,225 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import datetime
+import functools
 import json
+import os
+import tempfile
 # from streamlit_option_menu import option_menu
-import matplotlib.pyplot as plt
 import altair as alt
 
 # Google Sheets setup
 SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 SPREADSHEET_NAME = "SwimmerLog"  # Replace with your Google Sheet name
 
-def get_google_sheet():
-    creds_dict = st.secrets["gcp_service_account"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
-    client = gspread.authorize(creds)
-    sheet = client.open(SPREADSHEET_NAME)
-    return sheet
+SWIMMERS = ["BVH", "AVH", "AA", "FGQ"]
+
+# Training schedule, keyed by weekday (0=Monday, 6=Sunday); rest days are omitted
+SCHEDULE_BY_WEEKDAY = {
+    0: "All swimmers, 5:45pm @ Claremont Pool",
+    2: "Masters session, 6:00pm @ Scarborough Pool",
+    4: "Technique session, 5:30pm @ Bold Park",
+    5: "Long swim, 7:00am @ Claremont Pool",
+    6: "Recovery swim, 8:00am @ Claremont Pool",
+}
+TRAINING_DAYS = sorted(SCHEDULE_BY_WEEKDAY)
+
+@functools.lru_cache(maxsize=1)
+def _creds():
+    return ServiceAccountCredentials.from_json_keyfile_dict(dict(st.secrets["gcp_service_account"]), SCOPE)
+
+@st.cache_resource
+def _get_spreadsheet():
+    return gspread.authorize(_creds()).open(SPREADSHEET_NAME)
+
+@st.cache_resource
+def _get_ws(name):
+    return _get_spreadsheet().worksheet(name)
 
 # Data model functions
+SHEET_NAMES = ["Sessions", "Targets", "CSSTests"]
+SESSIONS_CACHE_PATH = "sessions.parquet"
+SESSIONS_CACHE_ROW_COUNT_KEY = b"last_row_count"
+SESSION_NUMERIC_COLUMNS = ["distance_m", "total_time_min", "moving_time_min", "rest_estimate_min", "rpe"]
+
+def _frame_from_values(values):
+    if not values:
+        return pd.DataFrame()
+    headers, *rows = values
+    # The API drops trailing blank cells, so pad short rows with "" like get_all_records;
+    # cells past the header row are ignored
+    n = len(headers)
+    return pd.DataFrame([row[:n] + [""] * (n - len(row)) for row in rows], columns=headers)
+
+PENDING_FLUSH_ROWS = 5
+
+def _pending_rows():
+    return st.session_state.setdefault("pending_rows", {name: [] for name in SHEET_NAMES})
+
+def flush_pending_rows():
+    pending = _pending_rows()
+    flushed = False
+    for name, rows in pending.items():
+        if rows:
+            _get_ws(name).append_rows(rows)
+            pending[name] = []
+            flushed = True
+    if flushed:
+        load_sessions.clear()
+
+def _queue_row(name, row):
+    buffer = _pending_rows()[name]
+    buffer.append(row)
+    if len(buffer) >= PENDING_FLUSH_ROWS:
+        flush_pending_rows()
+    return pending_row_count()
+
+def pending_row_count():
+    return sum(len(rows) for rows in _pending_rows().values())
+
+def queued_message(label, pending):
+    if pending == 0:
+        return f"{label} saved to Google Sheets."
+    return f"{label} queued ({pending} pending) - press Sync to save to Google Sheets."
+
+def with_pending_sessions(sessions_df):
+    rows = _pending_rows()["Sessions"]
+    if not rows or sessions_df.columns.empty:
+        return sessions_df
+    pending_df = _normalise_sessions(_frame_from_values([list(sessions_df.columns)] + rows))
+    return pd.concat([sessions_df, pending_df], ignore_index=True)
+
+def _read_sessions_cache():
+    try:
+        table = pq.read_table(SESSIONS_CACHE_PATH)
+        last_row_count = int(table.schema.metadata[SESSIONS_CACHE_ROW_COUNT_KEY])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, 0
+    return table.to_pandas(), last_row_count
+
+def _normalise_sessions(df):
+    # Blank cells come back as "" next to numbers, which Parquet can't store in one column
+    df = df.copy()
+    for col in df.columns:
+        if col in SESSION_NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        else:
+            df[col] = df[col].astype(str)
+    return df
+
+def _write_sessions_cache(df, last_row_count):
+    # The row count is stored in the Parquet metadata and the file is swapped in with
+    # os.replace, so rows and count can't get out of step between sessions or on a crash
+    tmp_path = None
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            SESSIONS_CACHE_ROW_COUNT_KEY: str(last_row_count).encode(),
+        })
+        fd, tmp_path = tempfile.mkstemp(
+            suffix=".parquet.tmp", dir=os.path.dirname(os.path.abspath(SESSIONS_CACHE_PATH))
+        )
+        os.close(fd)
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, SESSIONS_CACHE_PATH)
+    except (OSError, ValueError, TypeError):
+        # The mirror is best-effort (read-only directory, odd header cells); keep serving the fetched frame
+        pass
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def clear_sessions_cache():
+    try:
+        os.remove(SESSIONS_CACHE_PATH)
+    except OSError:
+        pass
+    load_sessions.clear()
+
+@st.cache_data(ttl=60)
 def load_sessions():
-    sheet = get_google_sheet()
-    worksheet = sheet.worksheet("Sessions")
-    data = worksheet.get_all_records(expected_headers=[])
-    return pd.DataFrame(data)
+    worksheet = _get_ws("Sessions")
+    cached_df, last_row_count = _read_sessions_cache()
+    if cached_df is None:
+        values = worksheet.get(
+            "A:Z", value_render_option="UNFORMATTED_VALUE", date_time_render_option="FORMATTED_STRING"
+        )
+        df, last_row_count = _normalise_sessions(_frame_from_values(values)), len(values)
+    else:
+        # Only fetch rows appended since the last sync
+        new_rows = worksheet.get(
+            f"A{last_row_count + 1}:Z", value_render_option="UNFORMATTED_VALUE", date_time_render_option="FORMATTED_STRING"
+        )
+        if not new_rows:
+            return cached_df
+        new_df = _normalise_sessions(_frame_from_values([list(cached_df.columns)] + list(new_rows)))
+        df = pd.concat([cached_df, new_df], ignore_index=True)
+        last_row_count += len(new_rows)
+    if last_row_count:
+        _write_sessions_cache(df, last_row_count)
+    return df
 
 def save_session(session_data):
-    sheet = get_google_sheet()
-    worksheet = sheet.worksheet("Sessions")
-    worksheet.append_row(list(session_data.values()))
-
-def load_targets():
-    sheet = get_google_sheet()
-    worksheet = sheet.worksheet("Targets")
-    data = worksheet.get_all_records()
-    return pd.DataFrame(data)
+    return _queue_row("Sessions", list(session_data.values()))
 
 def save_target(target_data):
-    sheet = get_google_sheet()
-    worksheet = sheet.worksheet("Targets")
-    worksheet.append_row(list(target_data.values()))
-
-def load_css_tests():
-    sheet = get_google_sheet()
-    worksheet = sheet.worksheet("CSSTests")
-    data = worksheet.get_all_records()
-    return pd.DataFrame(data)
+    return _queue_row("Targets", list(target_data.values()))
 
 def save_css_test(test_data):
-    sheet = get_google_sheet()
-    worksheet = sheet.worksheet("CSSTests")
-    worksheet.append_row(list(test_data.values()))
+    return _queue_row("CSSTests", list(test_data.values()))
+
+DASHBOARD_COLUMNS = ['date', 'distance_m', 'rpe', 'swimmer']
+
+@st.cache_data(ttl=60, max_entries=4)
+def prepare_sessions(sessions_df):
+    # Called with DASHBOARD_COLUMNS only, so notes/sets_text aren't hashed or copied.
+    # Non-ISO dates typed into the sheet become NaT and drop out of the weekly groupby
+    df = pd.DataFrame({
+        'date': pd.to_datetime(sessions_df['date'], format='%Y-%m-%d', errors='coerce', cache=True),
+        'distance_m': sessions_df['distance_m'].to_numpy(),
+        'rpe': sessions_df['rpe'].to_numpy(),
+        'swimmer': sessions_df['swimmer'].to_numpy()
+    }, index=sessions_df.index)
+    distance_km = df['distance_m'].to_numpy(dtype=np.float64) * 0.001
+    df['distance_km'] = distance_km
+    df['load'] = distance_km * df['rpe'].to_numpy(dtype=np.float64)
+    df['week'] = df['date'].dt.to_period('W').dt.start_time
+    # Swimmers typed in by hand on the sheet are kept as extra categories
+    extra_swimmers = sorted(set(df['swimmer'].dropna().astype(str).unique()) - set(SWIMMERS))
+    df['swimmer'] = pd.Categorical(df['swimmer'], categories=SWIMMERS + extra_swimmers)
+    return df
+
+def weekly_summary(df):
+    weekly_df = df.groupby(['week', 'swimmer'], sort=False, observed=True).agg(
+        total_distance_km=('distance_km', 'sum'),
+        total_load=('load', 'sum'),
+        mean_rpe=('rpe', 'mean'),
+        std_rpe=('rpe', 'std')
+    ).reset_index()
+    std_rpe = weekly_df['std_rpe'].to_numpy()
+    weekly_df['monotony'] = weekly_df['mean_rpe'].to_numpy() / np.where(std_rpe == 0, 1.0, std_rpe)  # Avoid div by zero
+    weekly_df['strain'] = weekly_df['monotony'] * weekly_df['total_load']
+    return weekly_df
+
+def _today_and_week():
+    # The week start only changes when the date does, so keep it in session_state
+    today = datetime.date.today()
+    if st.session_state.get("_today") != today:
+        st.session_state["_today"] = today
+        st.session_state["_current_week"] = pd.Timestamp(today).to_period('W').start_time
+    return today, st.session_state["_current_week"]
+
+_BANNER_TMPL = """
+    <div style="background-color: #2768F5; padding: 16px; text-align: center; font-size: 22px; font-weight: bold; color: white; margin-bottom: 16px; width: 100vw; margin-left: calc(-50vw + 50%);">
+        Team Bon Dia Mate - {title}
+    </div>
+    """
 
 # Main app
 def main():
@@ -66,17 +234,7 @@ def main():
         )
 
     # Banner
-    page_titles = {
-        "Dashboard": "Dashboard",
-        "Log Session": "Log Session",
-        "CSS Test": "CSS Test",
-        "Targets": "Targets"
-    }
-    st.markdown(f"""
-    <div style="background-color: #2768F5; padding: 16px; text-align: center; font-size: 22px; font-weight: bold; color: white; margin-bottom: 16px; width: 100vw; margin-left: calc(-50vw + 50%);">
-        Team Bon Dia Mate - {page_titles[selected]}
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(_BANNER_TMPL.format(title=selected), unsafe_allow_html=True)
 
     if selected == "Log Session":
         log_session_page()
@@ -87,11 +245,42 @@ def main():
     elif selected == "Targets":
         targets_page()
 
+    # Drawn after the page so rows queued on this run are counted
+    with st.sidebar:
+        pending_count = pending_row_count()
+        if st.button(f"Sync ({pending_count} pending)", disabled=pending_count == 0):
+            flush_pending_rows()
+            st.rerun()
+
+_MONTHS = {month: i for i, month in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1
+)}
+DATE_FORMATS = ["%d-%b-%y", "%d-%b-%Y", "%Y-%m-%d", "%d/%m/%Y", "%d/%m/%y"]
+
+def parse_session_date(date_str):
+    date_str = date_str.strip()
+    try:
+        # Fast, locale-independent path for the dd-mmm-yy default
+        d, m, y = date_str.split("-")
+        if len(y) == 2:
+            # Same century pivot as strptime's %y: 69-99 -> 19xx, 00-68 -> 20xx
+            year = int(y)
+            year += 1900 if year >= 69 else 2000
+            return datetime.date(year, _MONTHS[m.title()], int(d))
+    except (KeyError, ValueError):
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date: {date_str!r}")
+
 def log_session_page():
     st.title("Log Swim Session")
 
     with st.form("session_form"):
-        date_str = st.text_input("Date (dd-mmm-yy)", value=datetime.date.today().strftime("%d-%b-%y"))
+        date_str = st.text_input("Date (dd-mmm-yy, dd-mmm-yyyy, yyyy-mm-dd or dd/mm/yyyy)", value=datetime.date.today().strftime("%d-%b-%y"))
         environment = st.selectbox("Environment", ["pool", "open_water"])
         distance_m = st.number_input("Distance (m)", min_value=0, step=100)
         total_time_min = st.number_input("Total Time (min)", min_value=0.0, step=0.1)
@@ -103,15 +292,15 @@ def log_session_page():
         rpe = st.slider("Intensity (RPE 1-10)", 1, 10, 5)
         notes = st.text_area("Notes", placeholder="How you felt, niggles, water temp")
         team = st.text_input("Team", "")
-        swimmer = st.selectbox("Swimmer", ["BVH", "AVH", "AA", "FGQ"])
+        swimmer = st.selectbox("Swimmer", SWIMMERS)
 
         submitted = st.form_submit_button("Submit")
 
         if submitted:
             try:
-                date = datetime.datetime.strptime(date_str, "%d-%b-%y").date()
+                date = parse_session_date(date_str)
             except ValueError:
-                st.error("Invalid date format. Please use dd-mmm-yy (e.g., 04-Nov-25)")
+                st.error("Invalid date format. Please use dd-mmm-yy, dd-mmm-yyyy, yyyy-mm-dd, dd/mm/yyyy or dd/mm/yy (e.g., 04-Nov-25)")
                 return
             session_data = {
                 "date": str(date),
@@ -128,39 +317,34 @@ def log_session_page():
                 "team": team,
                 "swimmer": swimmer
             }
-            save_session(session_data)
-            st.success("Session logged successfully!")
+            pending = save_session(session_data)
+            st.success(queued_message("Session", pending))
 
 def dashboard_page():
     st.title("Dashboard")
 
-    sessions_df = load_sessions()
+    if st.button("Refresh"):
+        clear_sessions_cache()
+
+    # Include rows queued this session so they show before the next Sync
+    sessions_df = with_pending_sessions(load_sessions())
     if sessions_df.empty:
         st.write("No sessions logged yet.")
         return
 
-    df = sessions_df.copy()
-    df['date'] = pd.to_datetime(df['date'])
-    df['distance_km'] = df['distance_m'] / 1000
-    df['load'] = df['distance_km'] * df['rpe']
-
-    # Weekly aggregations by swimmer
-    df['week'] = df['date'].dt.to_period('W').apply(lambda r: r.start_time)
-    weekly_df = df.groupby(['week', 'swimmer']).agg({
-        'distance_km': 'sum',
-        'load': 'sum',
-        'rpe': ['mean', 'std']
-    }).reset_index()
-    weekly_df.columns = ['week', 'swimmer', 'total_distance_km', 'total_load', 'mean_rpe', 'std_rpe']
-    weekly_df['monotony'] = weekly_df['mean_rpe'] / weekly_df['std_rpe'].replace(0, 1)  # Avoid div by zero
-    weekly_df['strain'] = weekly_df['monotony'] * weekly_df['total_load']
+    df = prepare_sessions(sessions_df[DASHBOARD_COLUMNS])
 
     # Current week data
-    current_week = pd.Timestamp.now().to_period('W').start_time
+    today, current_week = _today_and_week()
+    last_week = current_week - pd.Timedelta(days=7)
+
+    # Weekly aggregations by swimmer. The history charts need every week; with them
+    # hidden only the last two weeks (all the summary tiles need) are aggregated
+    show_full_history = st.toggle("Show full history", value=True)
+    weekly_df = weekly_summary(df if show_full_history else df[df['date'] >= last_week])
     current_week_df = weekly_df[weekly_df['week'] == current_week]
 
     # Last week data
-    last_week = current_week - pd.Timedelta(days=7)
     last_week_df = weekly_df[weekly_df['week'] == last_week]
 
     # Create three columns for the summary section
@@ -178,74 +362,54 @@ def dashboard_page():
         st.markdown('<div style="background-color: #00008B; color: white; padding: 10px;"><strong>Last Week\'s KM by Swimmer</strong></div>', unsafe_allow_html=True)
         if not last_week_df.empty:
             # Create pie chart data
-            pie_values = last_week_df['total_distance_km'].values
-            pie_labels = last_week_df['swimmer'].values
             colors = ['darkgreen', 'darkred', 'darkblue', 'pink']
-            fig, ax = plt.subplots(figsize=(2.8, 2.8))
-            wedges, texts, autotexts = ax.pie(pie_values, autopct=lambda pct: f'{pct/100.*sum(pie_values):.1f}km', startangle=90, colors=colors, textprops={'color':'white'})
-            ax.axis('equal')
-            ax.legend(wedges, pie_labels, title="Swimmers", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
-            st.pyplot(fig)
+            pie_chart = alt.Chart(last_week_df).mark_arc().encode(
+                theta='total_distance_km:Q',
+                color=alt.Color('swimmer:N', title='Swimmers', scale=alt.Scale(range=colors)),
+                tooltip=['swimmer', alt.Tooltip('total_distance_km:Q', title='KM', format='.1f')]
+            ).properties(
+                height=200
+            )
+            st.altair_chart(pie_chart)
         else:
             st.write("No data for last week.")
 
     with col3:
         st.markdown('<div style="background-color: #00008B; color: white; padding: 10px;"><strong>Next Training Session</strong></div>', unsafe_allow_html=True)
         # Get next training session
-        training_schedule = {
-            0: "Monday - All swimmers, 5:45pm @ Claremont Pool",  # Monday
-            1: "Tuesday - No training",  # Tuesday
-            2: "Wednesday - Masters session, 6:00pm @ Scarborough Pool",  # Wednesday
-            3: "Thursday - No training",  # Thursday
-            4: "Friday - Technique session, 5:30pm @ Bold Park",  # Friday
-            5: "Saturday - Long swim, 7:00am @ Claremont Pool",  # Saturday
-            6: "Sunday - Recovery swim, 8:00am @ Claremont Pool"  # Sunday
-        }
-
-        today = datetime.date.today()
         current_day = today.weekday()  # 0=Monday, 6=Sunday
-
-        # Find next training day
-        next_day = current_day
-        days_ahead = 0
-        while days_ahead < 7:
-            next_day = (current_day + days_ahead) % 7
-            if "No training" not in training_schedule[next_day]:
-                break
-            days_ahead += 1
-
+        days_ahead = min((d - current_day) % 7 for d in TRAINING_DAYS)
         next_date = today + datetime.timedelta(days=days_ahead)
-        day_name = next_date.strftime("%A")
-        session_info = training_schedule[next_day].replace("Monday", day_name).replace("Tuesday", day_name).replace("Wednesday", day_name).replace("Thursday", day_name).replace("Friday", day_name).replace("Saturday", day_name).replace("Sunday", day_name)
+        session_info = f"{next_date.strftime('%A')} - {SCHEDULE_BY_WEEKDAY[next_date.weekday()]}"
 
         st.write(f"{next_date.strftime('%a %d-%b')}")
         st.write(session_info)
 
-    # Pivot for clustered bar chart
-    distance_pivot = weekly_df.pivot(index='week', columns='swimmer', values='total_distance_km').fillna(0)
-
-    # Charts
-    st.subheader("Weekly Distance by Swimmer")
-    # Create custom stacked bar chart with wider bars
-    melted_df = distance_pivot.reset_index().melt(id_vars='week', var_name='swimmer', value_name='distance')
-    melted_df['week'] = melted_df['week'].dt.strftime('%Y-%m-%d')
-    melted_df = melted_df.sort_values('week')
-    chart = alt.Chart(melted_df).mark_bar(size=60).encode(
-        x=alt.X('week:O', title='Week'),
-        y=alt.Y('distance:Q', title='Distance (KM)', stack='zero'),
-        color='swimmer:N'
-    ).properties(
-        width=600,
-        height=400
-    )
-    st.altair_chart(chart)
-
-    st.subheader("Training Load")
-    st.line_chart(weekly_df.set_index('week')[['total_load', 'monotony', 'strain']])
+    if show_full_history:
+        # Charts
+        st.subheader("Weekly Distance by Swimmer")
+        # Create custom stacked bar chart with wider bars
+        melted_df = weekly_df[['week', 'swimmer', 'total_distance_km']].rename(columns={'total_distance_km': 'distance'}).sort_values('week')
+        melted_df['week'] = melted_df['week'].dt.strftime('%Y-%m-%d')
+        chart = alt.Chart(melted_df).mark_bar(size=60).encode(
+            x=alt.X('week:O', title='Week'),
+            y=alt.Y('distance:Q', title='Distance (KM)', stack='zero'),
+            color='swimmer:N'
+        ).properties(
+            width=600,
+            height=400
+        )
+        st.altair_chart(chart)
+
+        st.subheader("Training Load")
+        st.line_chart(weekly_df.set_index('week')[['total_load', 'monotony', 'strain']])
 
     # Last 10 sessions
     st.subheader("Last 10 Sessions")
-    st.dataframe(df.sort_values('date', ascending=False).head(10))
+    latest_df = df.sort_values('date', ascending=False).head(10)
+    st.dataframe(sessions_df.loc[latest_df.index].assign(**{
+        col: latest_df[col] for col in ['date', 'distance_km', 'load', 'week']
+    }))
 
 def css_test_page():
     st.title("CSS Test Helper")
@@ -268,8 +432,9 @@ def css_test_page():
                     "time_400_s": time_400_s,
                     "css_s_per_100": css_pace
                 }
-                save_css_test(test_data)
+                pending = save_css_test(test_data)
                 st.success(f"CSS Pace: {css_pace:.2f} s/100m")
+                st.info(queued_message("CSS test", pending))
             else:
                 st.error("Please enter valid times.")
 
@@ -289,8 +454,8 @@ def targets_page():
                 "swimmer": swimmer,
                 "km_target": km_target
             }
-            save_target(target_data)
-            st.success("Target set!")
+            pending = save_target(target_data)
+            st.success(queued_message("Target", pending))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file